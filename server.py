@@ -1,19 +1,31 @@
 import os
-import io
-import json
 
-from flask import Flask, request, jsonify
+# One Tesseract thread per page worker, avoids oversubscribing the CPU
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+import asyncio
+import hashlib
+import queue
+import threading
+from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+
+from quart import Quart, Response, request, jsonify
 from dotenv import load_dotenv
 
-import pdfplumber
+from pypdf import PdfReader
+from pdf2image import convert_from_bytes
 from docx import Document
 from PIL import Image
-import pytesseract
 
 from google import genai
 from google.genai import types
 
-from flask_cors import CORS
+from quart_cors import cors
+from cachetools import TTLCache
+from pydantic import BaseModel
+import ijson
+import orjson
 
 # ------------------------------------------------
 # Load environment variables
@@ -24,8 +36,8 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 if not GEMINI_API_KEY:
     raise ValueError("GEMINI_API_KEY not found in .env")
 
-# If Tesseract is not in PATH:
-# pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+# If tessdata is not found automatically, point TESSDATA_PREFIX at it:
+# TESSDATA_PREFIX=C:\Program Files\Tesseract-OCR\tessdata
 
 # ------------------------------------------------
 # Initialize Gemini client
@@ -33,153 +45,470 @@ if not GEMINI_API_KEY:
 client = genai.Client(api_key=GEMINI_API_KEY)
 
 # ------------------------------------------------
-# Flask app
+# Quart app (async Flask-compatible API)
 # ------------------------------------------------
-app = Flask(__name__)
-CORS(app)
+app = Quart(__name__)
+app = cors(app)
 
 app.config["MAX_CONTENT_LENGTH"] = 10 * 1024 * 1024  # 10 MB max upload
 
+# ------------------------------------------------
+# Parsed resume cache (keyed by SHA-256 of the extracted text)
+# ------------------------------------------------
+_resume_cache = TTLCache(maxsize=1024, ttl=24 * 60 * 60)
+_resume_cache_lock = threading.Lock()
+
+def resume_cache_key(raw_text: str) -> str:
+    return hashlib.sha256(raw_text.encode("utf-8")).hexdigest()
+
+def get_cached_resume(key: str):
+    with _resume_cache_lock:
+        return _resume_cache.get(key)
+
+def cache_resume(key: str, parsed: dict):
+    with _resume_cache_lock:
+        _resume_cache[key] = parsed
+
 # ------------------------------------------------
 # Helpers: extract text from files
 # ------------------------------------------------
-def extract_text_from_pdf(file_bytes: bytes) -> str:
-    text = []
-    with pdfplumber.open(io.BytesIO(file_bytes)) as pdf:
-        for page in pdf.pages:
-            page_text = page.extract_text() or ""
-            text.append(page_text)
+# Extractors take the upload stream directly, so the file is
+# never copied into an extra bytes buffer.
+DOCX_MIMETYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+def extract_text_from_pdf(stream) -> str:
+    # pypdf skips layout analysis, much lighter than pdfplumber for plain text
+    reader = PdfReader(stream)
+    text = "\n".join(page.extract_text() or "" for page in reader.pages).strip()
+
+    if text:
+        return text
+
+    # No text layer (scanned PDF) → OCR the rendered pages
+    return extract_text_from_scanned_pdf(stream)
+
+def extract_text_from_scanned_pdf(stream) -> str:
+    # poppler needs the raw bytes, only this path materializes them
+    stream.seek(0)
+    pages = convert_from_bytes(stream.read(), dpi=300, grayscale=True)
+    # Tesseract releases the GIL, so pages OCR in parallel on threads
+    text = _page_executor.map(ocr_image, pages)
     return "\n".join(text).strip()
 
-def extract_text_from_docx(file_bytes: bytes) -> str:
-    doc = Document(io.BytesIO(file_bytes))
+def extract_text_from_docx(stream) -> str:
+    doc = Document(stream)
     paragraphs = [p.text for p in doc.paragraphs]
     return "\n".join(paragraphs).strip()
 
-def extract_text_from_image(file_bytes: bytes) -> str:
-    image = Image.open(io.BytesIO(file_bytes))
-    text = pytesseract.image_to_string(image)
-    return text.strip()
+# ------------------------------------------------
+# Tesseract: keep loaded engines around instead of
+# spawning the CLI (and reloading eng.traineddata) per call.
+# An engine isn't thread-safe, so each call checks one out of the pool.
+# Engines are created on first use, so PDF/DOCX work on hosts
+# without libtesseract, and the pool is this worker's share of the CPUs.
+# ------------------------------------------------
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+TESS_POOL_SIZE = int(
+    os.getenv("TESS_POOL_SIZE") or max(1, (os.cpu_count() or 1) // WEB_CONCURRENCY)
+)
+
+# Idle engines, plus one slot per engine the pool may hold. Holding a slot
+# guarantees either an idle engine or room to create one, so nobody waits
+# on an engine that failed to be created.
+_tess_pool = queue.Queue()
+_tess_slots = threading.BoundedSemaphore(TESS_POOL_SIZE)
+
+# Shared across requests; at most one page per pooled engine runs at a time
+_page_executor = ThreadPoolExecutor(max_workers=TESS_POOL_SIZE)
+
+def _checkout_tess_engine():
+    _tess_slots.acquire()
+
+    try:
+        return _tess_pool.get_nowait()
+    except queue.Empty:
+        pass
+
+    try:
+        from tesserocr import PyTessBaseAPI, PSM
+        return PyTessBaseAPI(lang="eng", psm=PSM.AUTO)
+    except Exception:
+        _tess_slots.release()
+        raise
+
+def ocr_image(image) -> str:
+    api = _checkout_tess_engine()
+    try:
+        api.SetImage(image)
+        return api.GetUTF8Text().strip()
+    finally:
+        _tess_pool.put(api)
+        _tess_slots.release()
+
+# Larger images only add Tesseract work, ~300 DPI for a page is plenty
+OCR_MAX_SIDE = 2400
+
+def prepare_for_ocr(image):
+    if max(image.size) > OCR_MAX_SIDE:
+        image.thumbnail((OCR_MAX_SIDE, OCR_MAX_SIDE), Image.LANCZOS)
+    # Tesseract binarizes internally, colour is wasted work
+    return image.convert("L")
+
+def extract_text_from_image(stream) -> str:
+    image = Image.open(stream)
+    return ocr_image(prepare_for_ocr(image))
+
+EXTRACTORS = {
+    ".pdf": extract_text_from_pdf,
+    ".docx": extract_text_from_docx,
+    ".png": extract_text_from_image,
+    ".jpg": extract_text_from_image,
+    ".jpeg": extract_text_from_image,
+}
+
+MIMETYPE_EXTRACTORS = {
+    "application/pdf": extract_text_from_pdf,
+    DOCX_MIMETYPE: extract_text_from_docx,
+    "image/png": extract_text_from_image,
+    "image/jpeg": extract_text_from_image,
+}
 
 def extract_text(file_storage) -> str:
-    filename = file_storage.filename.lower()
-    file_bytes = file_storage.read()
-
-    if filename.endswith(".pdf"):
-        return extract_text_from_pdf(file_bytes)
-    elif filename.endswith(".docx"):
-        return extract_text_from_docx(file_bytes)
-    elif filename.endswith((".png", ".jpg", ".jpeg")):
-        return extract_text_from_image(file_bytes)
-    else:
-        return extract_text_from_pdf(file_bytes)
+    ext = os.path.splitext(file_storage.filename)[1].lower()
+    extractor = (
+        EXTRACTORS.get(ext)
+        or MIMETYPE_EXTRACTORS.get(file_storage.mimetype)
+        or extract_text_from_pdf
+    )
+    return extractor(file_storage.stream)
 
 # ------------------------------------------------
 # Convert resume text → JSON using Gemini
 # ------------------------------------------------
-def parse_resume_with_gemini(raw_text: str) -> dict:
-
-    system_prompt = """
+SYSTEM_PROMPT = """
 You are an expert resume parser.
 Extract structured data and return ONLY valid JSON.
 """
 
-    schema_prompt = """
-Use this JSON format:
-
-{
-  "name": "string or null",
-  "email": "string or null",
-  "phone": "string or null",
-  "location": "string or null",
-  "summary": "string or null",
-  "skills": [],
-  "experience": [],
-  "education": [],
-  "projects": [],
-  "social_links": {
-    "linkedin": null,
-    "github": null,
-    "portfolio": null
-  },
-  "certifications": [],
-  "extras": {
-    "raw_text_excerpt": "string or null"
-  }
-}
-"""
-
-    user_prompt = f"""
-Here is the resume text:
+# Structured output schema: Gemini returns JSON matching this directly.
+# Only None defaults: the Gemini schema converter rejects any other default.
+class SocialLinks(BaseModel):
+    linkedin: Optional[str] = None
+    github: Optional[str] = None
+    portfolio: Optional[str] = None
+
+class Experience(BaseModel):
+    job_title: Optional[str] = None
+    company: Optional[str] = None
+    location: Optional[str] = None
+    start_date: Optional[str] = None
+    end_date: Optional[str] = None
+    description: Optional[str] = None
+
+class Education(BaseModel):
+    degree: Optional[str] = None
+    field: Optional[str] = None
+    institution: Optional[str] = None
+    start_date: Optional[str] = None
+    end_date: Optional[str] = None
+
+class Project(BaseModel):
+    name: Optional[str] = None
+    description: Optional[str] = None
+    tech_stack: list[str]
+    link: Optional[str] = None
+
+class Certification(BaseModel):
+    name: Optional[str] = None
+    issuer: Optional[str] = None
+    year: Optional[str] = None
+
+class Extras(BaseModel):
+    raw_text_excerpt: Optional[str] = None
+
+class Resume(BaseModel):
+    name: Optional[str] = None
+    email: Optional[str] = None
+    phone: Optional[str] = None
+    location: Optional[str] = None
+    summary: Optional[str] = None
+    skills: list[str]
+    experience: list[Experience]
+    education: list[Education]
+    projects: list[Project]
+    social_links: SocialLinks
+    certifications: list[Certification]
+    extras: Extras
+
+class BatchedResume(Resume):
+    # Echoes n of the ===RESUME n=== marker so results can't be mixed up between callers
+    index: int
+
+RESUME_SCHEMA = Resume
+RESUME_BATCH_SCHEMA = list[BatchedResume]
+
+def resume_config(schema=RESUME_SCHEMA):
+    return types.GenerateContentConfig(
+        system_instruction=SYSTEM_PROMPT,
+        response_modalities=["TEXT"],
+        response_mime_type="application/json",
+        response_schema=schema,
+    )
 
-\"\"\"{raw_text}\"\"\"
+# Resumes are rarely over 10 KB; anything past this is wasted tokens
+MAX_RESUME_CHARS = 50_000
 
-Return ONLY JSON. 
-Fill extras.raw_text_excerpt with a short excerpt.
-"""
+def build_resume_contents(raw_text: str) -> list:
+    # Resume text goes in as its own part instead of being copied into a prompt string
+    return [
+        types.Part.from_text(text="Here is the resume text:"),
+        types.Part.from_text(text=raw_text[:MAX_RESUME_CHARS]),
+        types.Part.from_text(
+            text="Fill extras.raw_text_excerpt with a short excerpt."
+        ),
+    ]
 
+async def parse_single_resume(raw_text: str) -> dict:
     # ⭐ FIXED Gemini API call
-    response = client.models.generate_content(
+    response = await client.aio.models.generate_content(
+        model="gemini-2.5-flash",
+        contents=build_resume_contents(raw_text),
+        config=resume_config()
+    )
+
+    return orjson.loads(response.text)
+
+async def parse_resume_batch(raw_texts: list) -> list:
+    """Parse several resumes with one Gemini call. Raises if the reply doesn't line up."""
+    parts = [
+        types.Part.from_text(
+            text=f"Here are {len(raw_texts)} resumes, each starting with a ===RESUME n=== line:"
+        ),
+    ]
+
+    for i, text in enumerate(raw_texts, start=1):
+        parts.append(types.Part.from_text(text=f"===RESUME {i}==="))
+        parts.append(types.Part.from_text(text=text[:MAX_RESUME_CHARS]))
+
+    parts.append(types.Part.from_text(
+        text=f"Return a JSON array with exactly {len(raw_texts)} objects, one per resume, "
+             "in the same order. Set index of each object to the n of its ===RESUME n=== line. "
+             "Fill extras.raw_text_excerpt of each object with a short excerpt of that resume."
+    ))
+
+    response = await client.aio.models.generate_content(
         model="gemini-2.5-flash",
-        contents=[
-            system_prompt,
-            schema_prompt,
-            user_prompt,
-        ],
-        config=types.GenerateContentConfig(response_modalities=["TEXT"])
+        contents=parts,
+        config=resume_config(RESUME_BATCH_SCHEMA)
+    )
+
+    parsed = orjson.loads(response.text)
+    indexes = [item.pop("index", None) for item in parsed]
+
+    # Any reordering, merge or split means results could go to the wrong caller
+    if indexes != list(range(1, len(raw_texts) + 1)):
+        raise ValueError("Gemini batch reply does not match the resumes sent")
+
+    return parsed
+
+# ------------------------------------------------
+# Micro-batching: coalesce concurrent parses into one Gemini call
+# ------------------------------------------------
+BATCH_MAX_SIZE = 8
+BATCH_WINDOW_SECONDS = 0.05
+BATCH_TIMEOUT_SECONDS = 90
+
+_batch_queue = None
+_batch_worker = None
+_batch_tasks = set()
+
+async def _resolve_singly(batch):
+    results = await asyncio.gather(
+        *(parse_single_resume(text) for text, _ in batch),
+        return_exceptions=True,
     )
+    for (_, future), result in zip(batch, results):
+        if future.done():
+            continue
+        if isinstance(result, BaseException):
+            future.set_exception(result)
+        else:
+            future.set_result(result)
+
+async def _run_batch(batch):
+    # A resume containing our own marker could confuse the split
+    if len(batch) == 1 or any("===RESUME" in text for text, _ in batch):
+        await _resolve_singly(batch)
+        return
+
+    try:
+        results = await parse_resume_batch([text for text, _ in batch])
+    except Exception as e:
+        print("Batch parse failed, retrying one by one:", e)
+        await _resolve_singly(batch)
+        return
+
+    for (_, future), result in zip(batch, results):
+        if not future.done():
+            future.set_result(result)
+
+async def _batch_loop():
+    loop = asyncio.get_running_loop()
+
+    while True:
+        batch = [await _batch_queue.get()]
+        deadline = loop.time() + BATCH_WINDOW_SECONDS
+
+        while len(batch) < BATCH_MAX_SIZE:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(_batch_queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+
+        # Don't hold up the next window while Gemini is answering
+        task = asyncio.create_task(_run_batch(batch))
+        _batch_tasks.add(task)
+        task.add_done_callback(_batch_tasks.discard)
 
-    raw_output = response.text.strip()
+def _ensure_batch_worker():
+    global _batch_queue, _batch_worker
 
-    # Remove accidental markdown
-    if raw_output.startswith("```"):
-        raw_output = raw_output.strip("`")
-        raw_output = raw_output.replace("json", "", 1).strip()
+    if _batch_worker is None or _batch_worker.done():
+        _batch_queue = asyncio.Queue()
+        _batch_worker = asyncio.create_task(_batch_loop())
+
+async def parse_resume_with_gemini(raw_text: str) -> dict:
+    _ensure_batch_worker()
+
+    future = asyncio.get_running_loop().create_future()
+    await _batch_queue.put((raw_text, future))
 
     try:
-        return json.loads(raw_output)
-    except:
-        return {
-            "error": "JSON parsing failed",
-            "raw_output": raw_output
-        }
+        return await asyncio.wait_for(asyncio.shield(future), BATCH_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        # Batch is taking too long, fall back to a dedicated call
+        return await parse_single_resume(raw_text)
+
+# ------------------------------------------------
+# Streaming parse: yield each top-level field as soon as it closes
+# ------------------------------------------------
+async def stream_resume_sections(raw_text: str):
+    sections = ijson.sendable_list()
+    parser = ijson.kvitems_coro(sections, "", use_float=True)
+
+    stream = await client.aio.models.generate_content_stream(
+        model="gemini-2.5-flash",
+        contents=build_resume_contents(raw_text),
+        config=resume_config()
+    )
+
+    async for chunk in stream:
+        # (an empty send would mean end-of-input to ijson)
+        if chunk.text:
+            parser.send(chunk.text.encode("utf-8"))
+        for section in sections:
+            yield section
+        del sections[:]
+
+    parser.close()
+    for section in sections:
+        yield section
 
 # ------------------------------------------------
 # API Route
 # ------------------------------------------------
 @app.route("/extract-resume", methods=["POST"])
-def extract_resume():
-    if "file" not in request.files:
+async def extract_resume():
+    files = await request.files
+
+    if "file" not in files:
         return jsonify({"error": "No file in request"}), 400
 
-    file = request.files["file"]
+    file = files["file"]
 
     if file.filename == "":
         return jsonify({"error": "No selected file"}), 400
 
     try:
-        raw_text = extract_text(file)
+        # pypdf / tesseract are blocking, keep them off the event loop
+        loop = asyncio.get_running_loop()
+        raw_text = await loop.run_in_executor(None, extract_text, file)
 
         if not raw_text.strip():
             return jsonify({"error": "Could not extract text"}), 400
 
-        parsed = parse_resume_with_gemini(raw_text)
+        cache_key = resume_cache_key(raw_text)
+        parsed = get_cached_resume(cache_key)
+
+        if parsed is None:
+            parsed = await parse_resume_with_gemini(raw_text)
+            cache_resume(cache_key, parsed)
+
+        return Response(orjson.dumps(parsed), status=200, mimetype="application/json")
+
+    except Exception as e:
+        print("Error:", e)
+        return jsonify({"error": "Server error", "details": str(e)}), 500
+
+@app.route("/extract-resume/stream", methods=["POST"])
+async def extract_resume_stream():
+    """Same as /extract-resume, but sends NDJSON: one {field: value} line per resume field."""
+    files = await request.files
+
+    if "file" not in files:
+        return jsonify({"error": "No file in request"}), 400
+
+    file = files["file"]
 
-        return jsonify(parsed), 200
+    if file.filename == "":
+        return jsonify({"error": "No selected file"}), 400
 
+    try:
+        loop = asyncio.get_running_loop()
+        raw_text = await loop.run_in_executor(None, extract_text, file)
     except Exception as e:
         print("Error:", e)
         return jsonify({"error": "Server error", "details": str(e)}), 500
 
+    if not raw_text.strip():
+        return jsonify({"error": "Could not extract text"}), 400
+
+    cache_key = resume_cache_key(raw_text)
+    cached = get_cached_resume(cache_key)
+
+    async def generate():
+        if cached is not None:
+            for key, value in cached.items():
+                yield orjson.dumps({key: value}) + b"\n"
+            return
+
+        parsed = {}
+        try:
+            async for key, value in stream_resume_sections(raw_text):
+                parsed[key] = value
+                yield orjson.dumps({key: value}) + b"\n"
+        except Exception as e:
+            print("Error:", e)
+            yield orjson.dumps({"error": "JSON parsing failed", "details": str(e)}) + b"\n"
+            return
+
+        cache_resume(cache_key, parsed)
+
+    return Response(generate(), mimetype="application/x-ndjson")
+
 @app.route("/", methods=["GET"])
-def main():
+async def main():
     return jsonify({"message": "Resume Parser Server Running"}), 200
 
 # ------------------------------------------------
-# Run the server
+# Run the server (see Procfile):
+#   WEB_CONCURRENCY=4 hypercorn --workers 4 --bind 0.0.0.0:5000 server:app
+# Keep WEB_CONCURRENCY equal to --workers so each worker's
+# Tesseract pool gets its share of the CPUs.
 # ------------------------------------------------
-if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
 
 
 
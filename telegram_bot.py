@@ -1,8 +1,12 @@
 import os
-import json
-import io
+import re
+import asyncio
+from collections import OrderedDict
 from datetime import datetime
 from dotenv import load_dotenv
+import orjson
+import aiofiles
+import aiofiles.os
 from google import genai
 from google.genai import types
 from telegram import Update
@@ -37,46 +41,78 @@ def user_memory_path(user_id):
     return f"memory_{user_id}.json"
 
 def user_history_path(user_id): 
-    return f"history_{user_id}.json"
+    return f"history_{user_id}.ndjson"
 
 # -----------------------------------------
 # Memory helpers
 # -----------------------------------------
-def load_memory(user_id):
+# In-process LRU cache so each message doesn't re-read the JSON file.
+# Write-through: save_memory updates both the cache and the disk.
+MEMORY_CACHE_SIZE = 1024
+_memory_cache = OrderedDict()
+# Rendered "key: value" lines per user, dropped whenever memory is saved
+_memory_text_cache = {}
+
+async def _load_memory_from_disk(user_id):
     path = user_memory_path(user_id)
-    if os.path.exists(path):
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
+    if await aiofiles.os.path.exists(path):
+        async with aiofiles.open(path, "rb") as f:
+            return orjson.loads(await f.read())
     return {}
 
-def save_memory(user_id, memory):
-    with open(user_memory_path(user_id), "w", encoding="utf-8") as f:
-        json.dump(memory, f, indent=4, ensure_ascii=False)
+def _cache_memory(user_id, memory):
+    _memory_cache[user_id] = memory
+    _memory_cache.move_to_end(user_id)
+    if len(_memory_cache) > MEMORY_CACHE_SIZE:
+        evicted, _ = _memory_cache.popitem(last=False)
+        _memory_text_cache.pop(evicted, None)
+
+async def load_memory(user_id):
+    memory = _memory_cache.get(user_id)
+    if memory is None:
+        loaded = await _load_memory_from_disk(user_id)
+        # Another handler may have cached (and changed) it during the read,
+        # keep that copy rather than overwriting it with the stale one
+        memory = _memory_cache.get(user_id)
+        if memory is None:
+            memory = loaded
+    _cache_memory(user_id, memory)
+    return memory
+
+async def save_memory(user_id, memory):
+    _cache_memory(user_id, memory)
+    _memory_text_cache.pop(user_id, None)
+    async with aiofiles.open(user_memory_path(user_id), "wb") as f:
+        await f.write(orjson.dumps(memory, option=orjson.OPT_INDENT_2))
+
+async def with_memory(user_id, text):
+    memory_text = _memory_text_cache.get(user_id)
+    if memory_text is None:
+        memory = await load_memory(user_id)
+        memory_text = "\n".join(f"{k}: {v}" for k, v in memory.items())
+        _memory_text_cache[user_id] = memory_text
+    else:
+        # Keep active users at the fresh end of the LRU (text is evicted with it)
+        _memory_cache.move_to_end(user_id)
+
+    # Nothing remembered yet → send the prompt as is
+    if not memory_text:
+        return text
+    return f"{text}\n\n(Memory:\n{memory_text})"
 
 # -----------------------------------------
 # History helpers
 # -----------------------------------------
-def save_history(user_id, sender, message):
+async def save_history(user_id, sender, message):
     entry = {
         "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
         "sender": sender,
         "message": message,
     }
 
-    path = user_history_path(user_id)
-    history = []
-
-    if os.path.exists(path):
-        with open(path, "r", encoding="utf-8") as f:
-            try:
-                history = json.load(f)
-            except json.JSONDecodeError:
-                history = []
-
-    history.append(entry)
-
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(history, f, indent=4, ensure_ascii=False)
+    # Append-only NDJSON: one entry per line, no rewrite of the whole file
+    async with aiofiles.open(user_history_path(user_id), "ab") as f:
+        await f.write(orjson.dumps(entry) + b"\n")
 
 # -----------------------------------------
 # Commands
@@ -101,29 +137,31 @@ async def clear(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.message.from_user.id
     path = user_history_path(user_id)
     # reset history
-    with open(path, "w", encoding="utf-8") as f:
-        f.write("[]")
+    async with aiofiles.open(path, "w", encoding="utf-8"):
+        pass
     await update.message.reply_text("🧹 Chat history cleared!")
 
 async def memory_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.message.from_user.id
-    memory = load_memory(user_id)
-    await update.message.reply_text(f"🧠 Memory:\n{json.dumps(memory, indent=4, ensure_ascii=False)}")
+    memory = await load_memory(user_id)
+    await update.message.reply_text(f"🧠 Memory:\n{orjson.dumps(memory, option=orjson.OPT_INDENT_2).decode()}")
+
+# "/remember key=value" (also "/remember@BotName key=value")
+REMEMBER_RE = re.compile(r"^/remember(?:@\w+)?\s+([^=\s][^=]*?)\s*=\s*(.+?)\s*$", re.DOTALL)
 
 async def remember(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.message.from_user.id
-    cmd = update.message.text.replace("/remember ", "", 1)
+    match = REMEMBER_RE.match(update.message.text)
 
-    if "=" not in cmd:
+    if not match:
         await update.message.reply_text("Use format: /remember key=value")
         return
 
-    key, value = cmd.split("=", 1)
-    key, value = key.strip(), value.strip()
+    key, value = match.groups()
 
-    memory = load_memory(user_id)
+    memory = await load_memory(user_id)
     memory[key] = value
-    save_memory(user_id, memory)
+    await save_memory(user_id, memory)
 
     await update.message.reply_text(f"✔ Remembered: {key} = {value}")
 
@@ -139,69 +177,70 @@ async def chat(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await stop(update, context)
         return
 
-    # Load memory
-    memory = load_memory(user_id)
-    memory_text = "\n".join([f"{k}: {v}" for k, v in memory.items()])
-
-    enhanced_input = f"{user_msg}\n\n(Memory:\n{memory_text})"
+    enhanced_input = await with_memory(user_id, user_msg)
 
-    # Create a chat session for this message
-    chat_session = client.chats.create(
+    # Single stateless call, no throwaway chat session per message
+    response = await client.aio.models.generate_content(
         model="gemini-2.5-flash",
+        contents=[enhanced_input],
         config=types.GenerateContentConfig(response_modalities=["TEXT"])
     )
 
-    reply = chat_session.send_message(enhanced_input)
-
-    ai_text = ""
-    for part in reply.parts:
-        if part.text:
-            ai_text += part.text
+    ai_text = response.text or ""
 
     # Reply to user
     await update.message.reply_text(ai_text)
 
     # Save to history
-    save_history(user_id, "You", user_msg)
-    save_history(user_id, "AI", ai_text)
+    await save_history(user_id, "You", user_msg)
+    await save_history(user_id, "AI", ai_text)
 
 # -----------------------------------------
 # Image Handler (Image Understanding)
 # -----------------------------------------
-async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_id = update.message.from_user.id
-    caption = update.message.caption or ""
-
-    # Load memory
-    memory = load_memory(user_id)
-    memory_text = "\n".join([f"{k}: {v}" for k, v in memory.items()])
-
-    # Build prompt
-    if caption.strip():
-        prompt = f"{caption}\n\n(Memory:\n{memory_text})"
-    else:
-        prompt = f"Describe this image in detail.\n\n(Memory:\n{memory_text})"
+# Telegram delivers each photo of an album as its own update,
+# so album photos are collected for a moment and answered together.
+ALBUM_WAIT_SECONDS = 0.5
+_album_buffers = {}
 
+async def download_photo(message):
     # Get the highest resolution photo
-    photo = update.message.photo[-1]
+    photo = message.photo[-1]
     file = await photo.get_file()
 
-    # Download to memory
-    bio = io.BytesIO()
-    await file.download_to_memory(out=bio)
-    image_bytes = bio.getvalue()
+    # Download straight into a buffer, no intermediate BytesIO
+    return bytes(await file.download_as_bytearray())
 
-    # Create image part
-    image_part = types.Part.from_bytes(
-        data=image_bytes,
-        mime_type="image/jpeg",  # Telegram sends JPEG by default
-    )
+async def answer_photos(messages):
+    first = messages[0]
+    user_id = first.from_user.id
+    caption = next((m.caption for m in messages if m.caption), "")
 
-    # Call Gemini with image + text
-    response = client.models.generate_content(
+    # Build prompt
+    if caption.strip():
+        prompt = await with_memory(user_id, caption)
+    elif len(messages) > 1:
+        prompt = await with_memory(user_id, "Describe these images in detail.")
+    else:
+        prompt = await with_memory(user_id, "Describe this image in detail.")
+
+    # Fetch every photo in parallel
+    blobs = await asyncio.gather(*(download_photo(m) for m in messages))
+
+    # Create image parts
+    image_parts = [
+        types.Part.from_bytes(
+            data=image_bytes,
+            mime_type="image/jpeg",  # Telegram sends JPEG by default
+        )
+        for image_bytes in blobs
+    ]
+
+    # Call Gemini with image(s) + text
+    response = await client.aio.models.generate_content(
         model="gemini-2.5-flash",  # Vision-capable model
         contents=[
-            image_part,
+            *image_parts,
             prompt
         ]
     )
@@ -219,11 +258,29 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
             ai_text = "I couldn't understand this image properly, sorry."
 
     # Reply to user
-    await update.message.reply_text(ai_text)
+    await first.reply_text(ai_text)
 
     # Save to history
-    save_history(user_id, "You (image)", caption or "[Image]")
-    save_history(user_id, "AI", ai_text)
+    placeholder = "[Image]" if len(messages) == 1 else f"[{len(messages)} images]"
+    await save_history(user_id, "You (image)", caption or placeholder)
+    await save_history(user_id, "AI", ai_text)
+
+async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    message = update.message
+    group_id = message.media_group_id
+
+    if group_id is None:
+        await answer_photos([message])
+        return
+
+    # Later photos of an album just join the buffer
+    if group_id in _album_buffers:
+        _album_buffers[group_id].append(message)
+        return
+
+    _album_buffers[group_id] = [message]
+    await asyncio.sleep(ALBUM_WAIT_SECONDS)
+    await answer_photos(_album_buffers.pop(group_id))
 
 # -----------------------------------------
 # RUN BOT
@@ -242,7 +299,8 @@ if __name__ == "__main__":
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, chat))
 
     # Photo messages
-    app.add_handler(MessageHandler(filters.PHOTO, handle_photo))
+    # Non-blocking so the rest of an album can arrive while the first photo waits
+    app.add_handler(MessageHandler(filters.PHOTO, handle_photo, block=False))
 
     print("Bot running with text + image understanding...")
     app.run_polling()